@@ -14,7 +14,32 @@ if (window.location.hostname === 'localhost' || window.location.hostname === '12
     console.log('Admin - External access mode:', API_BASE);
 }
 
-const API_TOKEN = 'family_secret_token';
+// Token della famiglia: ogni famiglia ha il proprio database sul backend.
+// Si imposta con un link "?token=..." oppure con changeFamilyToken();
+// senza token salvato si usa la famiglia principale.
+const TOKEN_STORAGE_KEY = 'familyTrackerToken';
+const urlParams = new URLSearchParams(window.location.search);
+if (urlParams.get('token')) {
+    localStorage.setItem(TOKEN_STORAGE_KEY, urlParams.get('token'));
+    // Non lasciare il token nella barra degli indirizzi
+    urlParams.delete('token');
+    const query = urlParams.toString();
+    window.history.replaceState(null, '', window.location.pathname + (query ? `?${query}` : ''));
+}
+const API_TOKEN = localStorage.getItem(TOKEN_STORAGE_KEY) || 'family_secret_token';
+
+function changeFamilyToken() {
+    const token = prompt('Token della famiglia (vuoto = famiglia principale):',
+                         localStorage.getItem(TOKEN_STORAGE_KEY) || '');
+    if (token === null) return;
+    if (token.trim()) {
+        localStorage.setItem(TOKEN_STORAGE_KEY, token.trim());
+    } else {
+        localStorage.removeItem(TOKEN_STORAGE_KEY);
+    }
+    window.location.reload();
+}
+window.changeFamilyToken = changeFamilyToken;
 
 console.log('Admin - API Base URL:', API_BASE);
 
@@ -29,6 +54,12 @@ let categories = [];
 let users = [];
 let expenses = [];
 
+// Righe selezionate per le operazioni massive
+const selectedIds = {
+    expenses: new Set(),
+    incomes: new Set()
+};
+
 // Funzione per valutare formule matematiche in modo sicuro
 function evaluateMathExpression(expression) {
     try {
@@ -91,6 +122,15 @@ function setupEventListeners() {
     document.getElementById('loadIncomes').addEventListener('click', loadIncomes);
     document.getElementById('incomeSearch').addEventListener('input', filterIncomes);
     
+    // Bulk operations
+    ['expenses', 'incomes'].forEach(table => {
+        document.getElementById(`${table}SelectAll`).addEventListener('change', (e) => toggleSelectAll(table, e.target.checked));
+        document.getElementById(`${table}BulkAction`).addEventListener('change', () => updateBulkValueInput(table));
+        document.getElementById(`${table}BulkPreview`).addEventListener('click', () => runBulkAction(table, true));
+        document.getElementById(`${table}BulkApply`).addEventListener('click', () => runBulkAction(table, false));
+        updateBulkValueInput(table);
+    });
+    
     // Users
     document.getElementById('addUser').addEventListener('click', addUser);
     document.getElementById('loadUsers').addEventListener('click', loadUsers);
@@ -167,6 +207,10 @@ async function loadInitialData() {
         const usersResponse = await fetch(`${API_BASE}/users`, { headers });
         users = await usersResponse.json();
         
+        // Suggerimenti per le operazioni massive
+        updateBulkValueInput('expenses');
+        updateBulkValueInput('incomes');
+        
         console.log('Dati iniziali caricati:', { categories: categories.length, users: users.length });
     } catch (error) {
         console.error('Errore nel caricamento dati iniziali:', error);
@@ -253,6 +297,8 @@ async function loadExpenses() {
     try {
         const response = await fetch(`${API_BASE}/expenses`, { headers });
         expenses = await response.json();
+        selectedIds.expenses.clear();
+        updateSelectedCount('expenses');
         
         displayExpenses(expenses);
         console.log(`Caricate ${expenses.length} spese`);
@@ -266,12 +312,13 @@ function displayExpenses(expensesToShow) {
     const tbody = document.getElementById('expensesTableBody');
     
     if (expensesToShow.length === 0) {
-        tbody.innerHTML = '<tr><td colspan="7" style="text-align: center;">Nessuna spesa trovata</td></tr>';
+        tbody.innerHTML = '<tr><td colspan="8" style="text-align: center;">Nessuna spesa trovata</td></tr>';
         return;
     }
     
     tbody.innerHTML = expensesToShow.map(expense => `
         <tr>
+            <td><input type="checkbox" class="row-select" data-id="${expense.id}" ${selectedIds.expenses.has(expense.id) ? 'checked' : ''} onchange="toggleRowSelection('expenses', ${expense.id}, this.checked)"></td>
             <td>${expense.id}</td>
             <td>${formatDate(expense.date)}</td>
             <td>${expense.category}</td>
@@ -412,6 +459,8 @@ async function loadIncomes() {
     try {
         const response = await fetch(`${API_BASE}/incomes`, { headers });
         incomes = await response.json();
+        selectedIds.incomes.clear();
+        updateSelectedCount('incomes');
         
         displayIncomes(incomes);
         console.log(`Caricate ${incomes.length} entrate`);
@@ -425,12 +474,13 @@ function displayIncomes(incomesToShow) {
     const tbody = document.getElementById('incomesTableBody');
     
     if (incomesToShow.length === 0) {
-        tbody.innerHTML = '<tr><td colspan="7" style="text-align: center;">Nessuna entrata trovata</td></tr>';
+        tbody.innerHTML = '<tr><td colspan="8" style="text-align: center;">Nessuna entrata trovata</td></tr>';
         return;
     }
     
     tbody.innerHTML = incomesToShow.map(income => `
         <tr>
+            <td><input type="checkbox" class="row-select" data-id="${income.id}" ${selectedIds.incomes.has(income.id) ? 'checked' : ''} onchange="toggleRowSelection('incomes', ${income.id}, this.checked)"></td>
             <td>${income.id}</td>
             <td>${formatDate(income.date)}</td>
             <td>${income.category}</td>
@@ -751,7 +801,111 @@ function showToast(message, type = 'success') {
     }, 4000);
 }
 
+// Bulk operations
+function toggleRowSelection(table, id, checked) {
+    if (checked) {
+        selectedIds[table].add(id);
+    } else {
+        selectedIds[table].delete(id);
+    }
+    updateSelectedCount(table);
+}
+
+function toggleSelectAll(table, checked) {
+    // Solo le righe visibili (rispetta la ricerca)
+    document.querySelectorAll(`#${table}TableBody .row-select`).forEach(checkbox => {
+        checkbox.checked = checked;
+        toggleRowSelection(table, parseInt(checkbox.dataset.id), checked);
+    });
+}
+
+function updateSelectedCount(table) {
+    document.getElementById(`${table}SelectedCount`).textContent = `${selectedIds[table].size} selezionate`;
+    if (selectedIds[table].size === 0) {
+        document.getElementById(`${table}SelectAll`).checked = false;
+    }
+}
+
+function updateBulkValueInput(table) {
+    const action = document.getElementById(`${table}BulkAction`).value;
+    const input = document.getElementById(`${table}BulkValue`);
+    const options = document.getElementById(`${table}BulkOptions`);
+    
+    input.style.display = action === 'delete' ? 'none' : '';
+    input.value = '';
+    input.type = action === 'shift_date' ? 'number' : 'text';
+    input.placeholder = {
+        set_category: 'Nuova categoria',
+        set_user: 'Nuovo utente',
+        shift_date: 'Giorni (es. 30 o -30)'
+    }[action] || '';
+    
+    const values = action === 'set_category' ? categories.map(cat => cat.name)
+                 : action === 'set_user' ? users
+                 : [];
+    options.innerHTML = values.map(value => `<option value="${value}">`).join('');
+}
+
+async function runBulkAction(table, dryRun) {
+    const ids = Array.from(selectedIds[table]);
+    if (ids.length === 0) {
+        showToast('Seleziona almeno una riga', 'error');
+        return;
+    }
+    
+    const action = document.getElementById(`${table}BulkAction`).value;
+    const value = document.getElementById(`${table}BulkValue`).value.trim();
+    const body = { filter: { ids }, action, dry_run: dryRun };
+    
+    if (action === 'shift_date') {
+        body.days = parseInt(value);
+        if (isNaN(body.days) || body.days === 0) {
+            showToast('Inserisci un numero di giorni valido', 'error');
+            return;
+        }
+    } else if (action !== 'delete') {
+        if (!value) {
+            showToast('Inserisci il nuovo valore', 'error');
+            return;
+        }
+        body.value = value;
+    }
+    
+    if (!dryRun && !confirm(`Applicare "${action}" a ${ids.length} righe? L'operazione non è reversibile.`)) return;
+    
+    try {
+        const response = await fetch(`${API_BASE}/admin/bulk/${table}`, {
+            method: 'POST',
+            headers,
+            body: JSON.stringify(body)
+        });
+        const result = await response.json();
+        
+        if (!response.ok) {
+            showToast(`Errore: ${result.detail}`, 'error');
+            return;
+        }
+        
+        const totals = result.totals.map(t => `${t.total.toFixed(2)} ${t.currency}`).join(', ');
+        const skipped = result.skipped > 0 ? `, ${result.skipped} saltate per data non valida` : '';
+        if (dryRun) {
+            showToast(`Anteprima: ${result.matched} righe (${totals || 'nessun importo'})${skipped}`, 'success');
+        } else {
+            showToast(`Operazione completata: ${result.affected} righe modificate${skipped}`, 'success');
+            if (table === 'expenses') {
+                await loadExpenses();
+            } else {
+                await loadIncomes();
+            }
+        }
+    } catch (error) {
+        console.error('Errore nell\'operazione massiva:', error);
+        showToast('Errore nell\'operazione massiva', 'error');
+    }
+}
+
 // Global functions for onclick handlers
+window.toggleRowSelection = toggleRowSelection;
 window.editExpense = editExpense;
 window.deleteExpense = deleteExpense;
 window.editIncome = editIncome;
@@ -0,0 +1,112 @@
+"""
+Micro-benchmark del middleware di sicurezza.
+
+Misura il costo per richiesta di advanced_security_middleware con un numero
+crescente di regole in blocklist (IP singoli e reti CIDR), per tre tipi di
+client: fuori dalle reti bloccate, dentro 10/8 ma non bloccati (lookup
+profondo nel trie) e già bloccati.
+
+Uso:
+    python bench_security.py [--requests 20000] [--rules 0 1000 10000]
+"""
+import argparse
+import asyncio
+import ipaddress
+import random
+import time
+
+from starlette.requests import Request
+from starlette.responses import Response
+
+import main
+
+
+async def call_next(request):
+    return Response("ok")
+
+
+def make_request(ip: str, path: str) -> Request:
+    return Request({
+        "type": "http",
+        "method": "GET",
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": b"",
+        "headers": [(b"user-agent", b"bench")],
+        "client": (ip, 12345),
+        "server": ("localhost", 8082),
+        "scheme": "http",
+    })
+
+
+def fill_blocklist(count: int) -> list:
+    """Riempie la blocklist in memoria (senza toccare il database).
+
+    Restituisce un indirizzo coperto da ciascuna regola.
+    """
+    main.IP_RULES["block"].clear()
+    rng = random.Random(42)
+    covered = []
+    for i in range(count):
+        # Reti piccole dentro 10.0.0.0/8: il resto di 10/8 resta libero
+        prefix = rng.choice([32, 32, 32, 28, 24])
+        address = ipaddress.IPv4Address((10 << 24) | rng.getrandbits(24))
+        network = ipaddress.ip_network(f"{address}/{prefix}", strict=False)
+        main.add_ip_rule("block", str(network), reason="bench",
+                         duration_seconds=3600 if i % 2 else None, persist=False)
+        covered.append(str(network.network_address))
+    return covered
+
+
+def free_addresses_in_10_8(count: int) -> list:
+    """IP dentro 10/8 ma fuori da ogni regola: il lookup scende in profondità nel trie"""
+    rng = random.Random(7)
+    addresses = []
+    while len(addresses) < count:
+        ip = str(ipaddress.IPv4Address((10 << 24) | rng.getrandbits(24)))
+        if not main.is_ip_blocked(ip):
+            addresses.append(ip)
+    return addresses
+
+
+async def run(clients: list, requests: int) -> float:
+    paths = ["/health", "/expenses", "/reports/monthly", "/categories"]
+    batch = [make_request(clients[i % len(clients)], paths[i % len(paths)]) for i in range(requests)]
+    main.REQUEST_COUNTS.clear()
+
+    start = time.perf_counter()
+    for request in batch:
+        await main.advanced_security_middleware(request, call_next)
+    return (time.perf_counter() - start) / requests * 1e6
+
+
+def main_bench():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--rules", type=int, nargs="+", default=[0, 1000, 10000])
+    args = parser.parse_args()
+
+    # Niente log per ogni richiesta durante la misura (anche i warning dei blocchi)
+    main.logging.disable(main.logging.WARNING)
+    # Nessuna pulizia periodica durante la misura (toccherebbe il database)
+    main.LAST_PURGE = time.time() + 10 ** 9
+
+    # Client sparsi su molti IP per non far scattare il rate limiting
+    spread = args.requests // 10 + 1
+    outside = [f"192.168.{i // 256}.{i % 256}" for i in range(spread)]
+
+    print("µs per richiesta attraverso advanced_security_middleware")
+    print(f"{'regole':>8} | {'fuori 10/8':>10} | {'10/8 libero':>11} | {'bloccato':>9}")
+    for count in args.rules:
+        covered = fill_blocklist(count)
+        inside = free_addresses_in_10_8(spread)
+
+        row = [asyncio.run(run(outside, args.requests)), asyncio.run(run(inside, args.requests))]
+        # Client già bloccati: la richiesta si ferma al primo controllo
+        blocked = f"{asyncio.run(run(covered, args.requests)):>9.2f}" if covered else f"{'-':>9}"
+
+        print(f"{count:>8} | {row[0]:>10.2f} | {row[1]:>11.2f} | {blocked}")
+
+
+if __name__ == "__main__":
+    main_bench()
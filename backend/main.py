@@ -8,8 +8,19 @@ import os
 import logging
 from datetime import datetime, timedelta
 import ipaddress
-from collections import defaultdict
+import re
+from collections import defaultdict, deque, OrderedDict
 import time
+import cProfile
+import pstats
+import random
+import threading
+import functools
+import inspect
+import contextvars
+import secrets
+from fastapi.routing import APIRoute
+from fastapi.concurrency import run_in_threadpool
 
 # Configurazione logging
 logging.basicConfig(
@@ -22,21 +33,228 @@ logging.basicConfig(
 )
 
 # Sistema di sicurezza avanzato
-BLOCKED_IPS = set()
 REQUEST_COUNTS = defaultdict(list)
-SUSPICIOUS_PATTERNS = [
-    'CONNECT', 'PROPFIND', 'MKCOL', 'OPTIONS', 'TRACE',
-    '.php', '.asp', '.jsp', 'wp-admin', 'phpMyAdmin',
-    'admin/config', '/config', '/setup', '/install'
-]
+
+# Pattern veramente pericolosi, compilati una sola volta in un'unica regex
+DANGEROUS_PATTERNS = ['.php', '.asp', '.jsp', 'wp-admin', 'phpMyAdmin']
+DANGEROUS_PATH_RE = re.compile("|".join(re.escape(p) for p in DANGEROUS_PATTERNS), re.IGNORECASE)
 
 # Rate limiting: max 1000 richieste per IP in 10 minuti (aumentato per debugging)
 MAX_REQUESTS_PER_IP = 1000
 TIME_WINDOW = 600  # 10 minuti
 
+# Durata dei blocchi automatici (None = permanente)
+RATE_LIMIT_BLOCK_SECONDS = 3600        # 1 ora
+SUSPICIOUS_BLOCK_SECONDS = 24 * 3600   # 1 giorno
+
+# Pulizia periodica di blocchi scaduti e contatori inattivi (dal middleware)
+PURGE_INTERVAL = 300                   # 5 minuti
+LAST_PURGE = 0.0
+
+class IPPrefixTrie:
+    """Trie binario sui bit dell'indirizzo per regole IP/CIDR.
+
+    Il lookup costa al massimo 32 (IPv4) o 128 (IPv6) passi, indipendentemente
+    dal numero di regole. Ogni nodo è una lista [figlio_0, figlio_1, regola].
+    """
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self._roots = {4: [None, None, None], 6: [None, None, None]}
+        self._rules = {}
+
+    def __len__(self):
+        return len(self._rules)
+
+    def __contains__(self, network: str) -> bool:
+        return network in self._rules
+
+    def rules(self) -> list:
+        return list(self._rules.values())
+
+    @staticmethod
+    def _bits(network):
+        value = int(network.network_address)
+        maxlen = network.max_prefixlen
+        return [(value >> (maxlen - 1 - i)) & 1 for i in range(network.prefixlen)]
+
+    def add(self, network, rule: dict):
+        node = self._roots[network.version]
+        for bit in self._bits(network):
+            if node[bit] is None:
+                node[bit] = [None, None, None]
+            node = node[bit]
+        node[2] = rule
+        self._rules[str(network)] = rule
+
+    def remove(self, network) -> bool:
+        if str(network) not in self._rules:
+            return False
+        del self._rules[str(network)]
+        path = [self._roots[network.version]]
+        bits = self._bits(network)
+        for bit in bits:
+            path.append(path[-1][bit])
+        path[-1][2] = None
+        # Pota i nodi rimasti vuoti
+        for depth in range(len(bits), 0, -1):
+            node = path[depth]
+            if node[0] is None and node[1] is None and node[2] is None:
+                path[depth - 1][bits[depth - 1]] = None
+            else:
+                break
+        return True
+
+    def match(self, ip: str, now: Optional[float] = None) -> Optional[dict]:
+        """Regola più specifica non scaduta che copre l'IP"""
+        try:
+            address = ipaddress.ip_address(ip)
+        except ValueError:
+            return None
+        if now is None:
+            now = time.time()
+        value = int(address)
+        maxlen = address.max_prefixlen
+        node = self._roots[address.version]
+        best = None
+        depth = 0
+        while node is not None:
+            rule = node[2]
+            if rule is not None and (rule["expires_at"] is None or rule["expires_at"] > now):
+                best = rule
+            if depth == maxlen:
+                break
+            node = node[(value >> (maxlen - 1 - depth)) & 1]
+            depth += 1
+        return best
+
+    def expired(self, now: Optional[float] = None) -> list:
+        if now is None:
+            now = time.time()
+        return [rule for rule in self._rules.values()
+                if rule["expires_at"] is not None and rule["expires_at"] <= now]
+
+# Blocklist e allowlist persistenti (tabella ip_rules), caricate all'avvio
+IP_RULES = {"block": IPPrefixTrie(), "allow": IPPrefixTrie()}
+
+def add_ip_rule(list_name: str, network: str, reason: str = "manual",
+                duration_seconds: Optional[float] = None, persist: bool = True) -> dict:
+    """Aggiunge un IP o una rete CIDR alla blocklist/allowlist"""
+    net = ipaddress.ip_network(network, strict=False)
+    now = time.time()
+    rule = {
+        "network": str(net),
+        "reason": reason,
+        "created_at": now,
+        "expires_at": now + duration_seconds if duration_seconds else None,
+    }
+    IP_RULES[list_name].add(net, rule)
+    if persist:
+        save_ip_rule(list_name, rule)
+    return rule
+
+def save_ip_rule(list_name: str, rule: dict):
+    """Scrive una regola nella tabella ip_rules"""
+    conn = get_main_db()
+    conn.execute(
+        "INSERT OR REPLACE INTO ip_rules (network, list, reason, created_at, expires_at) VALUES (?, ?, ?, ?, ?)",
+        (rule["network"], list_name, rule["reason"], rule["created_at"], rule["expires_at"])
+    )
+    conn.commit()
+    conn.close()
+
+def remove_ip_rule(list_name: str, network: str) -> bool:
+    """Rimuove una regola dalla blocklist/allowlist"""
+    net = ipaddress.ip_network(network, strict=False)
+    removed = IP_RULES[list_name].remove(net)
+    conn = get_main_db()
+    conn.execute("DELETE FROM ip_rules WHERE network=? AND list=?", (str(net), list_name))
+    conn.commit()
+    conn.close()
+    return removed
+
+def purge_expired_ip_rules() -> int:
+    """Elimina i blocchi temporanei scaduti dalla memoria e dal database"""
+    now = time.time()
+    purged = purge_expired_from_memory(now)
+    delete_expired_ip_rules(now)
+    return purged
+
+def purge_expired_from_memory(now: float) -> int:
+    """Toglie dal trie le regole scadute"""
+    purged = 0
+    for trie in IP_RULES.values():
+        for rule in trie.expired(now):
+            trie.remove(ipaddress.ip_network(rule["network"]))
+            purged += 1
+    return purged
+
+def delete_expired_ip_rules(now: float):
+    """Cancella dalla tabella ip_rules le regole scadute"""
+    conn = get_main_db()
+    conn.execute("DELETE FROM ip_rules WHERE expires_at IS NOT NULL AND expires_at <= ?", (now,))
+    conn.commit()
+    conn.close()
+
+async def periodic_security_purge():
+    """Ogni PURGE_INTERVAL secondi rimuove blocchi scaduti e IP senza richieste recenti"""
+    global LAST_PURGE
+    now = time.time()
+    if now - LAST_PURGE < PURGE_INTERVAL:
+        return
+    LAST_PURGE = now
+    
+    purged = purge_expired_from_memory(now)
+    for ip in [ip for ip, times in REQUEST_COUNTS.items() if not times or now - times[-1] >= TIME_WINDOW]:
+        del REQUEST_COUNTS[ip]
+    try:
+        await run_in_threadpool(delete_expired_ip_rules, now)
+    except sqlite3.Error as e:
+        logging.warning(f"⚠️ Cannot purge expired IP rules from database: {e}")
+    if purged:
+        logging.info(f"🧹 Purged {purged} expired IP rules")
+
+def load_ip_rules(conn: sqlite3.Connection):
+    """Ricarica blocklist/allowlist dal database"""
+    for trie in IP_RULES.values():
+        trie.clear()
+    conn.execute("DELETE FROM ip_rules WHERE expires_at IS NOT NULL AND expires_at <= ?", (time.time(),))
+    for row in conn.execute("SELECT network, list, reason, created_at, expires_at FROM ip_rules"):
+        if row["list"] not in IP_RULES:
+            continue
+        IP_RULES[row["list"]].add(ipaddress.ip_network(row["network"]), {
+            "network": row["network"],
+            "reason": row["reason"],
+            "created_at": row["created_at"],
+            "expires_at": row["expires_at"],
+        })
+
+async def block_ip_temporarily(ip: str, reason: str, duration_seconds: float):
+    """Blocco automatico temporaneo (ignora host che non sono indirizzi IP).
+
+    Il trie viene aggiornato subito; la scrittura su SQLite va nel threadpool
+    per non fermare l'event loop durante una raffica di richieste.
+    """
+    try:
+        rule = add_ip_rule("block", ip, reason=reason, duration_seconds=duration_seconds, persist=False)
+    except ValueError:
+        logging.warning(f"⚠️ Cannot block non-IP client host: {ip}")
+        return
+    try:
+        await run_in_threadpool(save_ip_rule, "block", rule)
+    except sqlite3.Error as e:
+        # Il blocco in memoria è già attivo: manca solo la persistenza
+        logging.warning(f"⚠️ Cannot persist block for {ip}: {e}")
+
+def is_ip_allowed(ip: str) -> bool:
+    """Controlla se un IP è in allowlist"""
+    return IP_RULES["allow"].match(ip) is not None
+
 def is_ip_blocked(ip: str) -> bool:
-    """Controlla se un IP è bloccato"""
-    return ip in BLOCKED_IPS
+    """Controlla se un IP è bloccato (blocchi scaduti ignorati)"""
+    return IP_RULES["block"].match(ip) is not None
 
 def is_rate_limited(ip: str) -> bool:
     """Controlla rate limiting per IP"""
@@ -48,32 +266,11 @@ def is_rate_limited(ip: str) -> bool:
     REQUEST_COUNTS[ip].append(now)
     
     # Controlla se supera il limite
-    if len(REQUEST_COUNTS[ip]) > MAX_REQUESTS_PER_IP:
-        BLOCKED_IPS.add(ip)
-        logging.warning(f"🚫 IP {ip} blocked for rate limiting ({len(REQUEST_COUNTS[ip])} requests)")
-        return True
-    
-    return False
+    return len(REQUEST_COUNTS[ip]) > MAX_REQUESTS_PER_IP
 
 def is_suspicious_request(request: Request) -> bool:
     """Rileva richieste sospette - versione ridotta per stabilità"""
-    path = str(request.url.path).lower()
-    method = request.method.upper()
-    user_agent = request.headers.get('user-agent', '').lower()
-    
-    # Solo pattern veramente pericolosi
-    dangerous_patterns = ['.php', '.asp', '.jsp', 'wp-admin', 'phpMyAdmin']
-    for pattern in dangerous_patterns:
-        if pattern.lower() in path:
-            return True
-    
-    # Ignoriamo user agent sospetti per ora (troppo restrittivo)
-    # suspicious_agents = ['curl', 'wget', 'scanner', 'bot', 'crawler']
-    # for agent in suspicious_agents:
-    #     if agent in user_agent and 'googlebot' not in user_agent:
-    #         return True
-    
-    return False
+    return DANGEROUS_PATH_RE.search(request.url.path) is not None
 
 # Configurazione logging
 logging.basicConfig(
@@ -89,6 +286,352 @@ logging.basicConfig(
 SHARED_SECRET = "family_secret_token"
 DB_PATH = os.getenv("DB_PATH", "./expenses.db")
 
+# Multi-famiglia: ogni token corrisponde a un database SQLite separato.
+# La famiglia "default" usa SHARED_SECRET e DB_PATH, che contiene anche il
+# registro delle famiglie e le regole IP.
+TENANTS_DIR = os.getenv("TENANTS_DIR", "./tenants")
+MAX_OPEN_TENANTS = int(os.getenv("MAX_OPEN_TENANTS", "8"))   # pool aperti contemporaneamente
+POOL_MAX_IDLE = int(os.getenv("POOL_MAX_IDLE", "4"))         # connessioni inattive per famiglia
+TENANT_NAME_RE = re.compile(r"^[a-z0-9_-]{1,40}$")
+DEFAULT_TENANT = {"name": "default", "db_path": DB_PATH, "created_at": None}
+TENANTS = {SHARED_SECRET: DEFAULT_TENANT}   # token -> famiglia
+CURRENT_TENANT = contextvars.ContextVar("current_tenant", default=DEFAULT_TENANT)
+
+# Profilazione on-demand (controllata da /admin/profiling).
+# Quando è spenta l'unico costo per richiesta è la lettura di due flag.
+PROFILING = {
+    "enabled": False,          # profilazione delle richieste con cProfile
+    "sample_rate": 0.0,        # frazione di richieste campionate (0.0 - 1.0)
+    "routes": set(),           # route profilate sempre, es. "GET /reports/monthly"
+    "top_n": 20,               # funzioni mostrate per route
+    "slow_query_log": False,   # registra le query più lente della soglia
+    "slow_query_ms": 100.0,
+}
+PROFILE_RESULTS = {}           # route -> {"count", "total_ms", "max_ms", "stats"}
+SLOW_QUERIES = deque(maxlen=200)
+PROFILING_LOCK = threading.Lock()
+# Un solo cProfile attivo alla volta: da Python 3.12 un secondo enable()
+# concorrente solleva ValueError
+PROFILER_ACTIVE = threading.Lock()
+
+def should_profile(route_key: str) -> bool:
+    """Decide se profilare la richiesta corrente"""
+    if route_key in PROFILING["routes"]:
+        return True
+    rate = PROFILING["sample_rate"]
+    return rate > 0 and random.random() < rate
+
+def record_profile(route_key: str, profiler: cProfile.Profile, duration_ms: float):
+    """Accumula le statistiche cProfile di una richiesta per la sua route"""
+    with PROFILING_LOCK:
+        entry = PROFILE_RESULTS.get(route_key)
+        if entry is None:
+            entry = {"count": 0, "total_ms": 0.0, "max_ms": 0.0, "stats": pstats.Stats(profiler)}
+            PROFILE_RESULTS[route_key] = entry
+        else:
+            entry["stats"].add(profiler)
+        entry["count"] += 1
+        entry["total_ms"] += duration_ms
+        entry["max_ms"] = max(entry["max_ms"], duration_ms)
+
+def top_functions(stats: pstats.Stats, limit: int) -> list:
+    """Restituisce le funzioni con il tempo cumulativo più alto"""
+    rows = sorted(stats.stats.items(), key=lambda item: item[1][3], reverse=True)[:limit]
+    return [
+        {
+            "function": f"{func} ({os.path.basename(filename)}:{line})",
+            "calls": nc,
+            "tottime_ms": round(tt * 1000, 3),
+            "cumtime_ms": round(ct * 1000, 3),
+        }
+        for (filename, line, func), (cc, nc, tt, ct, callers) in rows
+    ]
+
+class ProfiledRoute(APIRoute):
+    """Route che avvolge l'endpoint con cProfile quando la profilazione è attiva.
+
+    Si profila una richiesta alla volta: se un'altra è già sotto profilo la
+    richiesta gira normalmente. Fino a Python 3.11 il profiler vede solo il
+    thread della richiesta; da 3.12 è globale al processo, quindi i risultati
+    possono includere lavoro di richieste concorrenti. Gli endpoint async
+    restano invariati.
+    """
+
+    def __init__(self, path: str, endpoint, **kwargs):
+        if not inspect.iscoroutinefunction(endpoint):
+            methods = ",".join(sorted(kwargs.get("methods") or ["GET"]))
+            endpoint = self._wrap(endpoint, f"{methods} {path}")
+        super().__init__(path, endpoint, **kwargs)
+
+    @staticmethod
+    def _wrap(endpoint, route_key: str):
+        @functools.wraps(endpoint)
+        def profiled_endpoint(*args, **kwargs):
+            if not PROFILING["enabled"] or not should_profile(route_key):
+                return endpoint(*args, **kwargs)
+            # La profilazione non deve mai far fallire una richiesta
+            if not PROFILER_ACTIVE.acquire(blocking=False):
+                return endpoint(*args, **kwargs)
+            try:
+                profiler = cProfile.Profile()
+                try:
+                    profiler.enable()
+                except ValueError:
+                    # Un altro profiler (es. debugger) è già attivo
+                    return endpoint(*args, **kwargs)
+                start = time.perf_counter()
+                try:
+                    return endpoint(*args, **kwargs)
+                finally:
+                    profiler.disable()
+                    record_profile(route_key, profiler, (time.perf_counter() - start) * 1000)
+            finally:
+                PROFILER_ACTIVE.release()
+        return profiled_endpoint
+
+class ProfiledCursor(sqlite3.Cursor):
+    """Cursore che cronometra le query e registra quelle lente.
+
+    Il tempo comprende execute() e tutte le fetch: una SELECT viene valutata
+    quando il risultato è esaurito, alla execute successiva, alla close() o
+    quando la connessione torna al pool.
+    """
+    _pending = None   # [sql, parametri, secondi, numero di set di parametri]
+
+    def _timed(self, method, *args):
+        start = time.perf_counter()
+        try:
+            return method(*args)
+        finally:
+            if self._pending is not None:
+                self._pending[2] += time.perf_counter() - start
+
+    def execute(self, sql, parameters=()):
+        self.finish()
+        self._pending = [sql, parameters, 0.0, None]
+        try:
+            result = self._timed(super().execute, sql, parameters)
+        except Exception:
+            self.finish()
+            raise
+        if self.description is None:
+            self.finish()
+        else:
+            pending_cursors = getattr(self.connection, "profiled_cursors", None)
+            if pending_cursors is not None:
+                pending_cursors.add(self)
+        return result
+
+    def executemany(self, sql, seq_of_parameters):
+        self.finish()
+        seq_of_parameters = list(seq_of_parameters)
+        first = seq_of_parameters[0] if seq_of_parameters else ()
+        self._pending = [sql, first, 0.0, len(seq_of_parameters)]
+        try:
+            return self._timed(super().executemany, sql, seq_of_parameters)
+        finally:
+            self.finish()
+
+    def fetchone(self):
+        row = self._timed(super().fetchone)
+        if row is None:
+            self.finish()
+        return row
+
+    def fetchmany(self, size=None):
+        size = self.arraysize if size is None else size
+        rows = self._timed(super().fetchmany, size)
+        if len(rows) < size:
+            self.finish()
+        return rows
+
+    def fetchall(self):
+        rows = self._timed(super().fetchall)
+        self.finish()
+        return rows
+
+    def __next__(self):
+        try:
+            return self._timed(super().__next__)
+        except StopIteration:
+            self.finish()
+            raise
+
+    def close(self):
+        self.finish()
+        super().close()
+
+    def finish(self):
+        """Chiude la misura corrente e registra la query se è lenta"""
+        pending, self._pending = self._pending, None
+        if pending is None:
+            return
+        sql, parameters, seconds, batch_size = pending
+        duration_ms = seconds * 1000
+        if duration_ms >= PROFILING["slow_query_ms"]:
+            log_slow_query(self.connection, sql, parameters, duration_ms, batch_size)
+
+def log_slow_query(conn: sqlite3.Connection, sql: str, parameters, duration_ms: float,
+                   batch_size: Optional[int] = None):
+    """Salva SQL, parametri, durata e EXPLAIN QUERY PLAN di una query lenta"""
+    try:
+        # Cursore "normale" per non ricadere nel logging
+        plan_rows = sqlite3.Cursor(conn).execute(f"EXPLAIN QUERY PLAN {sql}", parameters).fetchall()
+        plan = [row[-1] for row in plan_rows]
+    except sqlite3.Error as e:
+        plan = [f"EXPLAIN non disponibile: {e}"]
+    SLOW_QUERIES.append({
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "tenant": CURRENT_TENANT.get()["name"],
+        "sql": " ".join(sql.split()),
+        "parameters": [str(p) for p in parameters] if not isinstance(parameters, dict)
+                      else {k: str(v) for k, v in parameters.items()},
+        "duration_ms": round(duration_ms, 3),
+        "batch_size": batch_size,   # executemany: parametri del primo set
+        "query_plan": plan,
+    })
+    logging.warning(f"🐢 Slow query ({duration_ms:.1f} ms): {' '.join(sql.split())[:200]}")
+
+class TenantConnection(sqlite3.Connection):
+    """Connessione SQLite di un pool; usa ProfiledCursor solo quando lo slow query log è attivo"""
+    profiled_cursors = None   # ProfiledCursor con risultato non ancora esaurito
+
+    def cursor(self, factory=None):
+        if factory is None:
+            factory = ProfiledCursor if PROFILING["slow_query_log"] else sqlite3.Cursor
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def finish_profiled_cursors(self):
+        """Registra le query lente rimaste aperte (es. fetchone su un COUNT)"""
+        cursors, self.profiled_cursors = self.profiled_cursors, set()
+        for cursor in cursors:
+            cursor.finish()
+
+class PooledConnection:
+    """Handle di un singolo prestito dal pool.
+
+    close() restituisce la connessione una sola volta: le chiamate successive
+    non fanno nulla e ogni altro uso dopo la close() dà errore, così un
+    handle già rilasciato non tocca la connessione passata a un'altra richiesta.
+    """
+    __slots__ = ("_conn", "_pool")
+
+    def __init__(self, pool: "TenantPool", conn: TenantConnection):
+        self._conn = conn
+        self._pool = pool
+
+    def __getattr__(self, name):
+        if self._conn is None:
+            raise sqlite3.ProgrammingError("Cannot operate on a closed database.")
+        return getattr(self._conn, name)
+
+    def close(self):
+        conn, self._conn = self._conn, None
+        if conn is not None:
+            self._pool.release(conn)
+
+class TenantPool:
+    """Pool di connessioni e cache di una singola famiglia"""
+
+    def __init__(self, tenant: dict):
+        self.name = tenant["name"]
+        self.db_path = tenant["db_path"]
+        self.cache = {}          # dati letti spesso (categorie, utenti)
+        self.cache_version = 0   # incrementato a ogni invalidazione
+        self._cache_lock = threading.Lock()
+        self.closed = False
+        self.initialized = False
+        self._idle = []
+        self._lock = threading.Lock()
+
+    def _connect(self) -> TenantConnection:
+        conn = sqlite3.connect(self.db_path, factory=TenantConnection,
+                               check_same_thread=False, timeout=10)
+        conn.row_factory = sqlite3.Row
+        # WAL: le letture non aspettano le scritture della stessa famiglia
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA busy_timeout=10000")
+        conn.profiled_cursors = set()
+        return conn
+
+    def acquire(self) -> PooledConnection:
+        with self._lock:
+            if self._idle:
+                return PooledConnection(self, self._idle.pop())
+            conn = self._connect()
+            if not self.initialized:
+                init_tenant_db(conn)
+                self.initialized = True
+            return PooledConnection(self, conn)
+
+    def release(self, conn: TenantConnection):
+        """Chiamata solo da PooledConnection.close(), una volta per prestito"""
+        with self._lock:
+            conn.finish_profiled_cursors()
+            conn.rollback()
+            if self.closed or len(self._idle) >= POOL_MAX_IDLE:
+                conn.close()
+            else:
+                self._idle.append(conn)
+
+    def close(self):
+        """Chiude le connessioni inattive; quelle in uso vengono chiuse al rilascio"""
+        with self._lock:
+            self.closed = True
+            for conn in self._idle:
+                conn.close()
+            self._idle.clear()
+
+    def cache_store(self, key: str, value, version: int):
+        """Salva in cache solo se nessuna scrittura è avvenuta dopo la lettura"""
+        with self._cache_lock:
+            if version == self.cache_version:
+                self.cache[key] = value
+
+    def invalidate(self, key: Optional[str] = None):
+        """Invalida una chiave (o tutta la cache) dopo una scrittura"""
+        with self._cache_lock:
+            self.cache_version += 1
+            if key is None:
+                self.cache.clear()
+            else:
+                self.cache.pop(key, None)
+
+    def idle_count(self) -> int:
+        return len(self._idle)
+
+# Pool aperti in ordine LRU: le famiglie inattive vengono chiuse per prime
+OPEN_POOLS = OrderedDict()
+POOLS_LOCK = threading.Lock()
+
+def get_pool(tenant: dict) -> TenantPool:
+    """Restituisce (aprendolo se serve) il pool della famiglia"""
+    with POOLS_LOCK:
+        pool = OPEN_POOLS.get(tenant["name"])
+        if pool is not None:
+            OPEN_POOLS.move_to_end(tenant["name"])
+            return pool
+        pool = TenantPool(tenant)
+        OPEN_POOLS[tenant["name"]] = pool
+        while len(OPEN_POOLS) > MAX_OPEN_TENANTS:
+            evicted_name, evicted = OPEN_POOLS.popitem(last=False)
+            evicted.close()
+            logging.info(f"💤 Closed idle tenant pool: {evicted_name}")
+        return pool
+
+def close_pool(tenant_name: str):
+    with POOLS_LOCK:
+        pool = OPEN_POOLS.pop(tenant_name, None)
+    if pool is not None:
+        pool.close()
+
+def current_pool() -> TenantPool:
+    """Pool (e cache) della famiglia della richiesta corrente"""
+    return get_pool(CURRENT_TENANT.get())
+
 # Modelli
 class Expense(BaseModel):
     id: Optional[int] = None
@@ -130,8 +673,46 @@ class UpdateIncome(BaseModel):
     currency: str
     user: str
 
+# Modelli operazioni massive (admin)
+class BulkFilter(BaseModel):
+    date_from: Optional[str] = None   # incluso, YYYY-MM-DD
+    date_to: Optional[str] = None     # incluso, YYYY-MM-DD
+    user: Optional[str] = None
+    category: Optional[str] = None
+    currency: Optional[str] = None
+    ids: Optional[List[int]] = None
+
+class BulkRequest(BaseModel):
+    filter: BulkFilter
+    action: str                       # set_category, set_user, delete, shift_date
+    value: Optional[str] = None       # nuova categoria/utente
+    days: Optional[int] = None        # giorni per shift_date (anche negativi)
+    dry_run: bool = False
+
+# Modello configurazione profilazione
+class ProfilingConfig(BaseModel):
+    enabled: Optional[bool] = None
+    sample_rate: Optional[float] = None
+    routes: Optional[List[str]] = None
+    top_n: Optional[int] = None
+    slow_query_log: Optional[bool] = None
+    slow_query_ms: Optional[float] = None
+
+# Modello regola IP (blocklist/allowlist)
+class IPRule(BaseModel):
+    network: str
+    list: str = "block"
+    reason: Optional[str] = "manual"
+    duration_seconds: Optional[float] = None
+
+# Modello nuova famiglia
+class Tenant(BaseModel):
+    name: str
+    token: Optional[str] = None
+
 # FastAPI app
 app = FastAPI()
+app.router.route_class = ProfiledRoute
 
 # Middleware di sicurezza semplificato per stabilità
 @app.middleware("http")
@@ -140,21 +721,27 @@ async def advanced_security_middleware(request: Request, call_next):
     method = request.method
     path = request.url.path
     
-    # 1. Controlla IP bloccati
-    if is_ip_blocked(client_ip):
-        logging.warning(f"🚫 Blocked IP attempted access: {client_ip} - {method} {path}")
-        return JSONResponse(status_code=403, content={"error": "Access denied"})
+    await periodic_security_purge()
     
-    # 2. Rate limiting (solo per IP veramente problematici)
-    if is_rate_limited(client_ip):
-        logging.warning(f"🚫 Rate limited IP: {client_ip} - {method} {path}")
-        return JSONResponse(status_code=429, content={"error": "Too many requests"})
-    
-    # 3. Solo richieste veramente pericolose
-    if is_suspicious_request(request):
-        BLOCKED_IPS.add(client_ip)
-        logging.warning(f"🚨 DANGEROUS REQUEST BLOCKED: {client_ip} - {method} {path}")
-        return JSONResponse(status_code=403, content={"error": "Suspicious activity detected"})
+    # 0. Gli IP in allowlist saltano tutti i controlli
+    if not is_ip_allowed(client_ip):
+        # 1. Controlla IP bloccati
+        if is_ip_blocked(client_ip):
+            logging.warning(f"🚫 Blocked IP attempted access: {client_ip} - {method} {path}")
+            return JSONResponse(status_code=403, content={"error": "Access denied"})
+        
+        # 2. Rate limiting (solo per IP veramente problematici)
+        if is_rate_limited(client_ip):
+            await block_ip_temporarily(client_ip, "rate_limit", RATE_LIMIT_BLOCK_SECONDS)
+            logging.warning(f"🚫 IP {client_ip} blocked for rate limiting ({len(REQUEST_COUNTS[client_ip])} requests)")
+            logging.warning(f"🚫 Rate limited IP: {client_ip} - {method} {path}")
+            return JSONResponse(status_code=429, content={"error": "Too many requests"})
+        
+        # 3. Solo richieste veramente pericolose
+        if is_suspicious_request(request):
+            await block_ip_temporarily(client_ip, "suspicious", SUSPICIOUS_BLOCK_SECONDS)
+            logging.warning(f"🚨 DANGEROUS REQUEST BLOCKED: {client_ip} - {method} {path}")
+            return JSONResponse(status_code=403, content={"error": "Suspicious activity detected"})
     
     # Rimuoviamo controlli troppo restrittivi per ora:
     # - Controllo caratteri non ASCII
@@ -178,13 +765,29 @@ app.add_middleware(
 )
 
 def get_db():
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    return conn
+    """Connessione al database della famiglia della richiesta corrente"""
+    return get_pool(CURRENT_TENANT.get()).acquire()
 
-def check_auth(x_token: str = Header(...)):
-    if x_token != SHARED_SECRET:
+def get_main_db():
+    """Connessione al database principale (registro famiglie e regole IP)"""
+    return get_pool(DEFAULT_TENANT).acquire()
+
+# Dipendenze async: la famiglia impostata qui è visibile negli endpoint
+# sincroni, che girano nel threadpool con una copia del contesto.
+def token_matches(x_token: str, token: str) -> bool:
+    # compare_digest su bytes: con str fallisce se l'header contiene caratteri non ASCII
+    return secrets.compare_digest(x_token.encode(), token.encode())
+
+async def check_auth(x_token: str = Header(...)):
+    tenant = next((t for token, t in list(TENANTS.items()) if token_matches(x_token, token)), None)
+    if tenant is None:
         raise HTTPException(status_code=401, detail="Unauthorized")
+    CURRENT_TENANT.set(tenant)
+
+async def check_admin(x_token: str = Header(...)):
+    if not token_matches(x_token, SHARED_SECRET):
+        raise HTTPException(status_code=401, detail="Unauthorized")
+    CURRENT_TENANT.set(DEFAULT_TENANT)
 
 # Handler per errori di validazione
 @app.exception_handler(422)
@@ -198,11 +801,13 @@ async def internal_error_handler(request: Request, exc):
     logging.error(f"Errore interno da {request.client.host}: {exc}")
     return JSONResponse(status_code=500, content={"error": "Internal server error"})
 
-# Inizializzazione DB
-@app.on_event("startup")
-def startup():
-    conn = get_db()
+# Inizializzazione DB di una famiglia (eseguita alla prima apertura del pool)
+# Versione schema salvata in PRAGMA user_version (0 = database mai inizializzato)
+SCHEMA_VERSION = 1
+
+def init_tenant_db(conn: sqlite3.Connection):
     c = conn.cursor()
+    user_version = c.execute("PRAGMA user_version").fetchone()[0]
     c.execute("""
     CREATE TABLE IF NOT EXISTS expenses (
         id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -228,17 +833,19 @@ def startup():
     )
     """)
     
-    # Aggiungi categorie di default se non esistono
-    default_categories = [
-        "Spesa", "Benzina", "Ristorante", "Bollette", "Casa", 
-        "Salute", "Sport", "Svago", "Abbigliamento", "Trasporti"
-    ]
-    
-    for category in default_categories:
-        try:
-            c.execute("INSERT OR IGNORE INTO categories (name) VALUES (?)", (category,))
-        except:
-            pass
+    # Aggiungi categorie di default solo su un database nuovo: il pool può
+    # essere riaperto dopo l'LRU e le categorie eliminate non devono tornare
+    if user_version == 0:
+        default_categories = [
+            "Spesa", "Benzina", "Ristorante", "Bollette", "Casa", 
+            "Salute", "Sport", "Svago", "Abbigliamento", "Trasporti"
+        ]
+        
+        for category in default_categories:
+            try:
+                c.execute("INSERT OR IGNORE INTO categories (name) VALUES (?)", (category,))
+            except:
+                pass
     
     # Non creare più utenti di default - gli utenti vengono gestiti dall'admin
     
@@ -254,9 +861,60 @@ def startup():
     )
     """)
     
+    if user_version < SCHEMA_VERSION:
+        c.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+    conn.commit()
+
+# Inizializzazione DB principale
+@app.on_event("startup")
+def startup():
+    os.makedirs(TENANTS_DIR, exist_ok=True)
+    conn = get_main_db()
+    c = conn.cursor()
+    
+    # Registro delle famiglie
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS tenants (
+        name TEXT PRIMARY KEY,
+        token TEXT UNIQUE NOT NULL,
+        db_path TEXT NOT NULL,
+        created_at TEXT
+    )
+    """)
+    
+    # Blocklist/allowlist IP persistenti (IP singoli o reti CIDR)
+    c.execute("""
+    CREATE TABLE IF NOT EXISTS ip_rules (
+        network TEXT NOT NULL,
+        list TEXT NOT NULL,
+        reason TEXT,
+        created_at REAL,
+        expires_at REAL,
+        PRIMARY KEY (network, list)
+    )
+    """)
+    
+    conn.commit()
+    load_ip_rules(conn)
+    load_tenants(conn)
     conn.commit()
     conn.close()
 
+def load_tenants(conn: sqlite3.Connection):
+    """Ricarica la mappa token -> famiglia dal registro"""
+    TENANTS.clear()
+    TENANTS[SHARED_SECRET] = DEFAULT_TENANT
+    for row in conn.execute("SELECT name, token, db_path, created_at FROM tenants"):
+        TENANTS[row["token"]] = {"name": row["name"], "db_path": row["db_path"], "created_at": row["created_at"]}
+
+@app.on_event("shutdown")
+def shutdown():
+    with POOLS_LOCK:
+        pools = list(OPEN_POOLS.values())
+        OPEN_POOLS.clear()
+    for pool in pools:
+        pool.close()
+
 
 # API Spese
 @app.post("/expenses", dependencies=[Depends(check_auth)])
@@ -389,12 +1047,19 @@ def monthly_report(year: int, month: int):
 # API Categorie
 @app.get("/categories", response_model=List[Category], dependencies=[Depends(check_auth)])
 def get_categories():
+    pool = current_pool()
+    version = pool.cache_version
+    cached = pool.cache.get("categories")
+    if cached is not None:
+        return cached
     conn = get_db()
     c = conn.cursor()
     c.execute("SELECT * FROM categories")
     rows = c.fetchall()
     conn.close()
-    return [Category(**dict(row)) for row in rows]
+    categories = [Category(**dict(row)) for row in rows]
+    pool.cache_store("categories", categories, version)
+    return categories
 
 @app.post("/categories", dependencies=[Depends(check_auth)])
 def add_category(category: Category):
@@ -403,6 +1068,7 @@ def add_category(category: Category):
     try:
         c.execute("INSERT INTO categories (name) VALUES (?)", (category.name,))
         conn.commit()
+        current_pool().invalidate("categories")
     except sqlite3.IntegrityError:
         raise HTTPException(status_code=400, detail="Category already exists")
     finally:
@@ -415,17 +1081,24 @@ def delete_category(category_id: int):
     c = conn.cursor()
     c.execute("DELETE FROM categories WHERE id = ?", (category_id,))
     conn.commit()
+    current_pool().invalidate("categories")
     conn.close()
     return {"status": "ok"}
 
 # API Utenti
 @app.get("/users", dependencies=[Depends(check_auth)])
 def get_users():
+    pool = current_pool()
+    version = pool.cache_version
+    cached = pool.cache.get("users")
+    if cached is not None:
+        return cached
     conn = get_db()
     c = conn.cursor()
     c.execute("SELECT name FROM users ORDER BY name")
     users = [row[0] for row in c.fetchall()]
     conn.close()
+    pool.cache_store("users", users, version)
     return users
 
 # ========== ADMIN ENDPOINTS ==========
@@ -455,6 +1128,7 @@ def reset_database():
         
         conn.commit()
         conn.close()
+        current_pool().invalidate()
         return {"status": "success", "message": "Database reset completato"}
     except Exception as e:
         return {"status": "error", "message": str(e)}
@@ -538,6 +1212,123 @@ def delete_income_admin(income_id: int):
         conn.close()
         raise HTTPException(status_code=500, detail=str(e))
 
+# Operazioni massive su spese/entrate
+BULK_TABLES = {"expenses": "Spese", "incomes": "Entrate"}
+BULK_ACTIONS = {"set_category", "set_user", "delete", "shift_date"}
+BULK_REPORT_MAX_IDS = 1000
+# Date che shift_date può spostare: YYYY-MM-DD (con eventuale orario) valida per SQLite
+ISO_DATE_SQL = "(date GLOB '[0-9][0-9][0-9][0-9]-[0-9][0-9]-[0-9][0-9]*' AND date(date) IS NOT NULL)"
+
+def is_iso_day(value: str) -> bool:
+    """True se value è una data YYYY-MM-DD valida"""
+    try:
+        return datetime.strptime(value, "%Y-%m-%d").strftime("%Y-%m-%d") == value
+    except ValueError:
+        return False
+
+def build_bulk_where(bulk_filter: BulkFilter):
+    """Traduce il filtro in una clausola WHERE parametrizzata"""
+    clauses, params = [], []
+    for bound in (bulk_filter.date_from, bulk_filter.date_to):
+        if bound and not is_iso_day(bound):
+            raise HTTPException(status_code=400, detail="date_from/date_to devono essere nel formato YYYY-MM-DD")
+    if bulk_filter.date_from:
+        clauses.append("date >= ?")
+        params.append(bulk_filter.date_from)
+    if bulk_filter.date_to:
+        # Giorno finale incluso anche per date con orario (es. 2024-05-31T10:30)
+        clauses.append("date < date(?, '+1 day')")
+        params.append(bulk_filter.date_to)
+    for column in ("user", "category", "currency"):
+        value = getattr(bulk_filter, column)
+        if value is not None:
+            clauses.append(f"{column} = ?")
+            params.append(value)
+    if bulk_filter.ids is not None:
+        if not bulk_filter.ids:
+            # Lista vuota: nessuna riga
+            clauses.append("0")
+        else:
+            clauses.append(f"id IN ({','.join('?' * len(bulk_filter.ids))})")
+            params.extend(bulk_filter.ids)
+    return " AND ".join(clauses), params
+
+@app.post("/admin/bulk/{table}", dependencies=[Depends(check_auth)])
+def bulk_update(table: str, bulk: BulkRequest):
+    """Applica un'azione a tutte le righe che rispettano il filtro, in un'unica transazione"""
+    if table not in BULK_TABLES:
+        raise HTTPException(status_code=404, detail="Tabella non supportata")
+    if bulk.action not in BULK_ACTIONS:
+        raise HTTPException(status_code=400, detail=f"Azione non valida: {', '.join(sorted(BULK_ACTIONS))}")
+    
+    where, params = build_bulk_where(bulk.filter)
+    if not where:
+        raise HTTPException(status_code=400, detail="Specificare almeno un filtro")
+    
+    # Righe su cui agisce lo statement; shift_date salta le date non ISO
+    target_where = where
+    if bulk.action in ("set_category", "set_user"):
+        if not bulk.value:
+            raise HTTPException(status_code=400, detail="Valore richiesto per questa azione")
+        column = "category" if bulk.action == "set_category" else "user"
+        statement = f"UPDATE {table} SET {column} = ? WHERE {target_where}"
+        statement_params = [bulk.value] + params
+    elif bulk.action == "shift_date":
+        if not bulk.days:
+            raise HTTPException(status_code=400, detail="Numero di giorni richiesto per shift_date")
+        target_where = f"{where} AND {ISO_DATE_SQL}"
+        # substr(date, 11) conserva l'eventuale orario (es. "T10:30")
+        statement = f"UPDATE {table} SET date = date(date, ?) || substr(date, 11) WHERE {target_where}"
+        statement_params = [f"{bulk.days:+d} days"] + params
+    else:
+        statement = f"DELETE FROM {table} WHERE {target_where}"
+        statement_params = params
+    
+    conn = get_db()
+    c = conn.cursor()
+    try:
+        # Lock di scrittura subito: conteggio e modifica vedono le stesse righe
+        c.execute("BEGIN IMMEDIATE")
+        c.execute(f"SELECT id FROM {table} WHERE {target_where} ORDER BY id", params)
+        ids = [row[0] for row in c.fetchall()]
+        c.execute(f"SELECT currency, COUNT(*), SUM(amount) FROM {table} WHERE {target_where} GROUP BY currency", params)
+        totals = [{"currency": row[0], "count": row[1], "total": row[2]} for row in c.fetchall()]
+        skipped_ids = []
+        if target_where != where:
+            c.execute(f"SELECT id FROM {table} WHERE {where} AND NOT COALESCE({ISO_DATE_SQL}, 0) ORDER BY id", params)
+            skipped_ids = [row[0] for row in c.fetchall()]
+        
+        affected = 0
+        if not bulk.dry_run:
+            c.execute(statement, statement_params)
+            affected = c.rowcount
+            conn.commit()
+        else:
+            conn.rollback()
+        conn.close()
+    except HTTPException:
+        conn.close()
+        raise
+    except Exception as e:
+        conn.close()
+        raise HTTPException(status_code=500, detail=str(e))
+    
+    if not bulk.dry_run:
+        logging.info(f"🧹 Bulk {bulk.action} on {table}: {affected} rows")
+    return {
+        "status": "success",
+        "table": table,
+        "action": bulk.action,
+        "dry_run": bulk.dry_run,
+        "matched": len(ids),
+        "affected": affected,
+        "totals": totals,
+        "ids": ids[:BULK_REPORT_MAX_IDS],
+        "ids_truncated": len(ids) > BULK_REPORT_MAX_IDS,
+        "skipped": len(skipped_ids),             # shift_date: date non ISO lasciate invariate
+        "skipped_ids": skipped_ids[:BULK_REPORT_MAX_IDS],
+    }
+
 # Gestione utenti - Aggiungi
 @app.post("/admin/users", dependencies=[Depends(check_auth)])
 def add_user(user: User):
@@ -546,6 +1337,7 @@ def add_user(user: User):
     try:
         c.execute("INSERT INTO users (name) VALUES (?)", (user.name,))
         conn.commit()
+        current_pool().invalidate("users")
         conn.close()
         return {"status": "success", "message": f"Utente '{user.name}' aggiunto"}
     except sqlite3.IntegrityError:
@@ -571,6 +1363,7 @@ def update_user(old_name: str, user: User):
         c.execute("UPDATE expenses SET user=? WHERE user=?", (user.name, old_name))
         
         conn.commit()
+        current_pool().invalidate("users")
         conn.close()
         return {"status": "success", "message": f"Utente '{old_name}' rinominato in '{user.name}'"}
     except sqlite3.IntegrityError:
@@ -601,6 +1394,7 @@ def delete_user(user_name: str):
             raise HTTPException(status_code=404, detail="Utente non trovato")
         
         conn.commit()
+        current_pool().invalidate("users")
         conn.close()
         return {"status": "success", "message": f"Utente '{user_name}' eliminato"}
     except Exception as e:
@@ -662,10 +1456,11 @@ def get_database_stats():
         raise HTTPException(status_code=500, detail=str(e))
 
 # Security monitoring endpoint
-@app.get("/admin/security", dependencies=[Depends(check_auth)])
+@app.get("/admin/security", dependencies=[Depends(check_admin)])
 def get_security_stats():
     """Statistiche di sicurezza per amministratori"""
-    total_blocked = len(BLOCKED_IPS)
+    purge_expired_ip_rules()
+    blocked = IP_RULES["block"].rules()
     recent_requests = sum(len(requests) for requests in REQUEST_COUNTS.values())
     
     # Top IP con più richieste
@@ -676,25 +1471,64 @@ def get_security_stats():
     )[:10]
     
     return {
-        "blocked_ips_count": total_blocked,
-        "blocked_ips": list(BLOCKED_IPS)[:20],  # Mostra solo i primi 20
+        "blocked_ips_count": len(blocked),
+        "blocked_ips": [rule["network"] for rule in blocked][:20],  # Mostra solo i primi 20
+        "allowed_ips_count": len(IP_RULES["allow"]),
         "active_connections": recent_requests,
         "top_requesting_ips": top_ips,
         "security_events": {
-            "rate_limited": len([ip for ip in BLOCKED_IPS if len(REQUEST_COUNTS.get(ip, [])) > MAX_REQUESTS_PER_IP//2]),
-            "suspicious_patterns": len([ip for ip in BLOCKED_IPS])
+            "rate_limited": len([rule for rule in blocked if rule["reason"] == "rate_limit"]),
+            "suspicious_patterns": len([rule for rule in blocked if rule["reason"] == "suspicious"])
         }
     }
 
-@app.post("/admin/unblock-ip", dependencies=[Depends(check_auth)])
+@app.get("/admin/ip-rules", dependencies=[Depends(check_admin)])
+def list_ip_rules():
+    """Elenca blocklist e allowlist con le relative scadenze"""
+    purge_expired_ip_rules()
+    return {list_name: trie.rules() for list_name, trie in IP_RULES.items()}
+
+@app.post("/admin/ip-rules", dependencies=[Depends(check_admin)])
+def add_ip_rule_admin(rule: IPRule):
+    """Blocca o consente un IP/rete CIDR, opzionalmente per un tempo limitato"""
+    if rule.list not in IP_RULES:
+        raise HTTPException(status_code=400, detail="list deve essere 'block' o 'allow'")
+    if rule.duration_seconds is not None and rule.duration_seconds <= 0:
+        raise HTTPException(status_code=400, detail="duration_seconds deve essere positivo")
+    try:
+        added = add_ip_rule(rule.list, rule.network, rule.reason or "manual", rule.duration_seconds)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="IP o rete CIDR non valida")
+    logging.info(f"🛡️ IP rule added by admin: {rule.list} {added['network']}")
+    return {"status": "success", "rule": added}
+
+@app.delete("/admin/ip-rules", dependencies=[Depends(check_admin)])
+def delete_ip_rule_admin(network: str, list: str = "block"):
+    """Rimuove un IP/rete CIDR dalla blocklist o dall'allowlist"""
+    if list not in IP_RULES:
+        raise HTTPException(status_code=400, detail="list deve essere 'block' o 'allow'")
+    try:
+        removed = remove_ip_rule(list, network)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="IP o rete CIDR non valida")
+    if not removed:
+        raise HTTPException(status_code=404, detail="Regola non trovata")
+    logging.info(f"🛡️ IP rule removed by admin: {list} {network}")
+    return {"status": "success", "message": f"{network} rimosso da {list}"}
+
+@app.post("/admin/unblock-ip", dependencies=[Depends(check_admin)])
 def unblock_ip(request: dict):
-    """Sblocca un IP specifico"""
+    """Sblocca un IP specifico (o una rete CIDR)"""
     ip_to_unblock = request.get("ip")
     if not ip_to_unblock:
         raise HTTPException(status_code=400, detail="IP address required")
     
-    if ip_to_unblock in BLOCKED_IPS:
-        BLOCKED_IPS.remove(ip_to_unblock)
+    try:
+        removed = remove_ip_rule("block", ip_to_unblock)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid IP address")
+    
+    if removed:
         if ip_to_unblock in REQUEST_COUNTS:
             REQUEST_COUNTS[ip_to_unblock] = []
         logging.info(f"✅ IP {ip_to_unblock} unblocked by admin")
@@ -702,21 +1536,138 @@ def unblock_ip(request: dict):
     else:
         return {"message": f"IP {ip_to_unblock} was not blocked"}
 
-@app.post("/admin/reset-security", dependencies=[Depends(check_auth)])
+@app.post("/admin/reset-security", dependencies=[Depends(check_admin)])
 def reset_security():
-    """Reset completo del sistema di sicurezza"""
-    global BLOCKED_IPS, REQUEST_COUNTS
-    
-    blocked_count = len(BLOCKED_IPS)
-    BLOCKED_IPS.clear()
+    """Reset completo del sistema di sicurezza (l'allowlist viene mantenuta)"""
+    blocked_count = len(IP_RULES["block"])
+    IP_RULES["block"].clear()
     REQUEST_COUNTS.clear()
     
+    conn = get_main_db()
+    conn.execute("DELETE FROM ip_rules WHERE list='block'")
+    conn.commit()
+    conn.close()
+    
     logging.info(f"🔄 Security system reset - {blocked_count} IPs unblocked")
     return {
         "message": f"Security system reset successfully", 
         "unblocked_ips": blocked_count
     }
 
+# Gestione famiglie (solo amministratore principale)
+@app.get("/admin/tenants", dependencies=[Depends(check_admin)])
+def list_tenants():
+    """Elenca le famiglie con lo stato del loro pool"""
+    result = []
+    for tenant in TENANTS.values():
+        pool = OPEN_POOLS.get(tenant["name"])
+        db_size = os.path.getsize(tenant["db_path"]) if os.path.exists(tenant["db_path"]) else 0
+        result.append({
+            "name": tenant["name"],
+            "db_path": tenant["db_path"],
+            "created_at": tenant["created_at"],
+            "db_size_bytes": db_size,
+            "open": pool is not None,
+            "idle_connections": pool.idle_count() if pool else 0,
+        })
+    return sorted(result, key=lambda t: t["name"])
+
+@app.post("/admin/tenants", dependencies=[Depends(check_admin)])
+def create_tenant(tenant: Tenant):
+    """Crea una nuova famiglia con il proprio database e token"""
+    if not TENANT_NAME_RE.match(tenant.name) or tenant.name == DEFAULT_TENANT["name"]:
+        raise HTTPException(status_code=400, detail="Nome famiglia non valido (a-z, 0-9, _ e -)")
+    token = tenant.token or secrets.token_urlsafe(24)
+    if token in TENANTS:
+        raise HTTPException(status_code=400, detail="Token già in uso")
+    
+    db_path = os.path.join(TENANTS_DIR, f"{tenant.name}.db")
+    created_at = datetime.now().isoformat(timespec="seconds")
+    conn = get_main_db()
+    try:
+        conn.execute(
+            "INSERT INTO tenants (name, token, db_path, created_at) VALUES (?, ?, ?, ?)",
+            (tenant.name, token, db_path, created_at)
+        )
+        conn.commit()
+    except sqlite3.IntegrityError:
+        raise HTTPException(status_code=400, detail="Famiglia già esistente")
+    finally:
+        conn.close()
+    
+    TENANTS[token] = {"name": tenant.name, "db_path": db_path, "created_at": created_at}
+    logging.info(f"🏠 Tenant created: {tenant.name}")
+    return {"status": "success", "name": tenant.name, "token": token, "db_path": db_path}
+
+@app.delete("/admin/tenants/{tenant_name}", dependencies=[Depends(check_admin)])
+def drop_tenant(tenant_name: str, delete_data: bool = True):
+    """Elimina una famiglia; con delete_data cancella anche il suo database"""
+    if tenant_name == DEFAULT_TENANT["name"]:
+        raise HTTPException(status_code=400, detail="La famiglia principale non può essere eliminata")
+    token = next((t for t, tenant in TENANTS.items() if tenant["name"] == tenant_name), None)
+    if token is None:
+        raise HTTPException(status_code=404, detail="Famiglia non trovata")
+    
+    db_path = TENANTS.pop(token)["db_path"]
+    close_pool(tenant_name)
+    conn = get_main_db()
+    conn.execute("DELETE FROM tenants WHERE name=?", (tenant_name,))
+    conn.commit()
+    conn.close()
+    
+    if delete_data:
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(db_path + suffix):
+                os.remove(db_path + suffix)
+    logging.info(f"🗑️ Tenant dropped: {tenant_name} (data deleted: {delete_data})")
+    return {"status": "success", "message": f"Famiglia '{tenant_name}' eliminata"}
+
+# Profilazione on-demand e slow query log
+@app.get("/admin/profiling", dependencies=[Depends(check_admin)])
+def get_profiling():
+    """Configurazione, top funzioni per route e query lente"""
+    top_n = PROFILING["top_n"]
+    with PROFILING_LOCK:
+        routes = {
+            route_key: {
+                "count": entry["count"],
+                "avg_ms": round(entry["total_ms"] / entry["count"], 3),
+                "max_ms": round(entry["max_ms"], 3),
+                "top_functions": top_functions(entry["stats"], top_n),
+            }
+            for route_key, entry in PROFILE_RESULTS.items()
+        }
+    return {
+        "config": {**PROFILING, "routes": sorted(PROFILING["routes"])},
+        "routes": routes,
+        "slow_queries": list(SLOW_QUERIES),
+    }
+
+@app.post("/admin/profiling", dependencies=[Depends(check_admin)])
+def update_profiling(config: ProfilingConfig):
+    """Attiva/disattiva la profilazione e ne modifica i parametri"""
+    if config.sample_rate is not None and not 0.0 <= config.sample_rate <= 1.0:
+        raise HTTPException(status_code=400, detail="sample_rate deve essere tra 0 e 1")
+    if config.top_n is not None and config.top_n < 1:
+        raise HTTPException(status_code=400, detail="top_n deve essere positivo")
+    if config.slow_query_ms is not None and config.slow_query_ms < 0:
+        raise HTTPException(status_code=400, detail="slow_query_ms non può essere negativo")
+    
+    for key, value in config.dict(exclude_none=True).items():
+        PROFILING[key] = set(value) if key == "routes" else value
+    
+    logging.info(f"🔬 Profiling config updated: enabled={PROFILING['enabled']}, "
+                 f"sample_rate={PROFILING['sample_rate']}, slow_query_log={PROFILING['slow_query_log']}")
+    return {"status": "success", "config": {**PROFILING, "routes": sorted(PROFILING["routes"])}}
+
+@app.post("/admin/profiling/reset", dependencies=[Depends(check_admin)])
+def reset_profiling():
+    """Svuota i risultati di profilazione e lo slow query log"""
+    with PROFILING_LOCK:
+        PROFILE_RESULTS.clear()
+        SLOW_QUERIES.clear()
+    return {"status": "success", "message": "Risultati di profilazione eliminati"}
+
 # Health check endpoint
 @app.get("/health")
 def health_check():
@@ -727,6 +1678,7 @@ if __name__ == "__main__":
     import uvicorn
     print("🚀 Avvio Family Tracker Backend...")
     print(f"📊 Database: {DB_PATH}")
+    print(f"🏠 Tenants: {TENANTS_DIR} (max {MAX_OPEN_TENANTS} open)")
     print(f"🔑 Token: {SHARED_SECRET}")
     print(f"🛡️ Security: Rate limiting enabled ({MAX_REQUESTS_PER_IP} req/10min)")
     uvicorn.run(app, host="0.0.0.0", port=8082, log_level="info")
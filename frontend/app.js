@@ -17,7 +17,32 @@ if (window.location.hostname === 'localhost' || window.location.hostname === '12
     console.log('Frontend - External access mode (forced HTTP):', API_BASE);
 }
 
-const API_TOKEN = 'family_secret_token';
+// Token della famiglia: ogni famiglia ha il proprio database sul backend.
+// Si imposta con un link "?token=..." oppure con changeFamilyToken();
+// senza token salvato si usa la famiglia principale.
+const TOKEN_STORAGE_KEY = 'familyTrackerToken';
+const urlParams = new URLSearchParams(window.location.search);
+if (urlParams.get('token')) {
+    localStorage.setItem(TOKEN_STORAGE_KEY, urlParams.get('token'));
+    // Non lasciare il token nella barra degli indirizzi
+    urlParams.delete('token');
+    const query = urlParams.toString();
+    window.history.replaceState(null, '', window.location.pathname + (query ? `?${query}` : ''));
+}
+const API_TOKEN = localStorage.getItem(TOKEN_STORAGE_KEY) || 'family_secret_token';
+
+function changeFamilyToken() {
+    const token = prompt('Token della famiglia (vuoto = famiglia principale):',
+                         localStorage.getItem(TOKEN_STORAGE_KEY) || '');
+    if (token === null) return;
+    if (token.trim()) {
+        localStorage.setItem(TOKEN_STORAGE_KEY, token.trim());
+    } else {
+        localStorage.removeItem(TOKEN_STORAGE_KEY);
+    }
+    window.location.reload();
+}
+window.changeFamilyToken = changeFamilyToken;
 
 console.log('Frontend - API Base URL:', API_BASE);
 console.log('Frontend - Current hostname:', window.location.hostname);
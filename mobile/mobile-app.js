@@ -17,7 +17,47 @@ if (window.location.hostname === 'localhost' || window.location.hostname === '12
     console.log('External access mode (forced HTTP):', API_BASE);
 }
 
-const API_TOKEN = 'family_secret_token';
+// Token della famiglia: ogni famiglia ha il proprio database sul backend.
+// Si imposta con un link "?token=..." oppure con changeFamilyToken();
+// senza token salvato si usa la famiglia principale.
+const TOKEN_STORAGE_KEY = 'familyTrackerToken';
+const urlParams = new URLSearchParams(window.location.search);
+if (urlParams.get('token')) {
+    localStorage.setItem(TOKEN_STORAGE_KEY, urlParams.get('token'));
+    // Non lasciare il token nella barra degli indirizzi
+    urlParams.delete('token');
+    const query = urlParams.toString();
+    window.history.replaceState(null, '', window.location.pathname + (query ? `?${query}` : ''));
+}
+const API_TOKEN = localStorage.getItem(TOKEN_STORAGE_KEY) || 'family_secret_token';
+
+// Coda offline e cache di categorie/utenti sono separate per famiglia:
+// le chiavi della famiglia principale restano quelle storiche.
+function familyStorageKey(name) {
+    const token = localStorage.getItem(TOKEN_STORAGE_KEY);
+    if (!token) return name;
+    let hash = 5381;
+    for (let i = 0; i < token.length; i++) {
+        hash = ((hash * 33) ^ token.charCodeAt(i)) >>> 0;
+    }
+    return `${name}_${hash.toString(36)}`;
+}
+
+function changeFamilyToken() {
+    const pending = offlineExpenses.length + offlineIncomes.length;
+    if (pending > 0 && !confirm(`Ci sono ${pending} movimenti offline non sincronizzati: ` +
+                                'resteranno in attesa per questa famiglia. Continuare?')) return;
+    const token = prompt('Token della famiglia (vuoto = famiglia principale):',
+                         localStorage.getItem(TOKEN_STORAGE_KEY) || '');
+    if (token === null) return;
+    if (token.trim()) {
+        localStorage.setItem(TOKEN_STORAGE_KEY, token.trim());
+    } else {
+        localStorage.removeItem(TOKEN_STORAGE_KEY);
+    }
+    window.location.reload();
+}
+window.changeFamilyToken = changeFamilyToken;
 
 console.log('API Base URL:', API_BASE);
 console.log('Current hostname:', window.location.hostname);
@@ -119,10 +159,10 @@ async function loadInitialData() {
             // Carica categorie
             const categoriesResponse = await fetch(`${API_BASE}/categories`, { headers });
             categories = await categoriesResponse.json();
-            localStorage.setItem('categories', JSON.stringify(categories));
+            localStorage.setItem(familyStorageKey('categories'), JSON.stringify(categories));
         } else {
             // Carica da localStorage se offline
-            const stored = localStorage.getItem('categories');
+            const stored = localStorage.getItem(familyStorageKey('categories'));
             categories = stored ? JSON.parse(stored) : [];
         }
         populateCategorySelect();
@@ -131,10 +171,10 @@ async function loadInitialData() {
             // Carica utenti
             const usersResponse = await fetch(`${API_BASE}/users`, { headers });
             users = await usersResponse.json();
-            localStorage.setItem('users', JSON.stringify(users));
+            localStorage.setItem(familyStorageKey('users'), JSON.stringify(users));
         } else {
             // Carica da localStorage se offline
-            const stored = localStorage.getItem('users');
+            const stored = localStorage.getItem(familyStorageKey('users'));
             users = stored ? JSON.parse(stored) : ['Dad', 'Mom', 'Kid1', 'Kid2'];
         }
         populateUserSelect();
@@ -145,8 +185,8 @@ async function loadInitialData() {
         console.log('Headers utilizzati:', headers);
         
         // Fallback to localStorage
-        const storedCategories = localStorage.getItem('categories');
-        const storedUsers = localStorage.getItem('users');
+        const storedCategories = localStorage.getItem(familyStorageKey('categories'));
+        const storedUsers = localStorage.getItem(familyStorageKey('users'));
         
         categories = storedCategories ? JSON.parse(storedCategories) : [];
         users = storedUsers ? JSON.parse(storedUsers) : ['Dad', 'Mom', 'Kid1', 'Kid2'];
@@ -727,21 +767,21 @@ function scheduleSync() {
 
 // LocalStorage per spese offline
 function saveOfflineExpenses() {
-    localStorage.setItem('offlineExpenses', JSON.stringify(offlineExpenses));
+    localStorage.setItem(familyStorageKey('offlineExpenses'), JSON.stringify(offlineExpenses));
 }
 
 function loadOfflineExpenses() {
-    const stored = localStorage.getItem('offlineExpenses');
+    const stored = localStorage.getItem(familyStorageKey('offlineExpenses'));
     offlineExpenses = stored ? JSON.parse(stored) : [];
 }
 
 // LocalStorage per entrate offline
 function saveOfflineIncomes() {
-    localStorage.setItem('offlineIncomes', JSON.stringify(offlineIncomes));
+    localStorage.setItem(familyStorageKey('offlineIncomes'), JSON.stringify(offlineIncomes));
 }
 
 function loadOfflineIncomes() {
-    const stored = localStorage.getItem('offlineIncomes');
+    const stored = localStorage.getItem(familyStorageKey('offlineIncomes'));
     offlineIncomes = stored ? JSON.parse(stored) : [];
 }
 